@@ -71,6 +71,19 @@ export const deleteConversation = async (conversationId) => {
     }
 };
 
+export const bulkDeleteConversations = async (conversationIds, archive = false) => {
+    try {
+        const response = await api.post('/conversations/bulk-delete', {
+            conversation_ids: conversationIds,
+            archive: archive
+        });
+        return response.data;
+    } catch (error) {
+        console.error("Error deleting conversations:", error);
+        throw error;
+    }
+};
+
 export const uploadFile = async (conversationId, file) => {
     try {
         const formData = new FormData();
@@ -87,6 +100,46 @@ export const uploadFile = async (conversationId, file) => {
     }
 };
 
+export const uploadFiles = async (conversationId, files) => {
+    try {
+        const formData = new FormData();
+        for (const file of files) {
+            formData.append('files', file);
+        }
+        const response = await api.post(`/upload/batch?conversation_id=${conversationId}`, formData, {
+            headers: {
+                'Content-Type': 'multipart/form-data',
+            },
+        });
+        return response.data;
+    } catch (error) {
+        console.error("Error uploading files:", error);
+        throw error;
+    }
+};
+
+export const getJob = async (jobId) => {
+    try {
+        const response = await api.get(`/jobs/${jobId}`);
+        return response.data;
+    } catch (error) {
+        console.error("Error fetching job:", error);
+        throw error;
+    }
+};
+
+export const searchHistory = async (query, { conversationId, limit = 20, offset = 0 } = {}) => {
+    try {
+        const params = { q: query, limit, offset };
+        if (conversationId) params.conversation_id = conversationId;
+        const response = await api.get('/search', { params });
+        return response.data;
+    } catch (error) {
+        console.error("Error searching history:", error);
+        throw error;
+    }
+};
+
 export const sendFeedback = async (messageId, conversationId, isPositive, comment = "") => {
     try {
         const response = await api.post('/feedback', {
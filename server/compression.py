@@ -0,0 +1,27 @@
+"""Transparent zlib compression for large text values."""
+import zlib
+
+# Below this many UTF-8 bytes compression isn't worth the CPU
+COMPRESSION_THRESHOLD = 1024
+# 0xFF never occurs in UTF-8, so stored plain text can't be mistaken for this
+COMPRESSED_PREFIX = b"\xffz"
+
+
+def encode_text(value: str):
+    """Return what to store: compressed bytes for long text, the text itself otherwise."""
+    data = value.encode("utf-8")
+    if len(data) >= COMPRESSION_THRESHOLD:
+        compressed = COMPRESSED_PREFIX + zlib.compress(data)
+        if len(compressed) < len(data):
+            return compressed
+    return value
+
+
+def decode_text(value):
+    """Inverse of encode_text; also accepts plain text and uncompressed bytes."""
+    if value is None or isinstance(value, str):
+        return value
+    value = bytes(value)
+    if value.startswith(COMPRESSED_PREFIX):
+        return zlib.decompress(value[len(COMPRESSED_PREFIX):]).decode("utf-8")
+    return value.decode("utf-8")
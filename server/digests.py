@@ -0,0 +1,202 @@
+"""Compact per-attachment digests used as prompt context instead of the raw text."""
+import re
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+
+import database
+import models
+import search
+
+MAX_SUMMARY_CHARS = 300
+MAX_FINDINGS = 8
+MAX_OUTLINE = 12
+MAX_PASSAGES = 3
+PASSAGE_TOKENS = 32
+
+SOURCE_EXTENSIONS = ('.py', '.js', '.jsx', '.css')
+# Words that make uploaded text worth treating as a lab report (also used by
+# jobs to decide on Gemini report analysis)
+REPORT_KEYWORDS = ["blood", "test", "report", "lab", "result"]
+
+# "Hemoglobin: 11.2 g/dL (Low)", "PCV = 33 %", "Glucose 110 mg/dL", "BP: 120/80 mmHg"
+_LAB_LINE = re.compile(
+    r"^(?P<name>[A-Za-z][A-Za-z0-9 ()/.,+-]{0,40}?)\s*(?::|=|\s)\s*"
+    r"(?P<value>[<>]?\d+(?:\.\d+)?)(?:/(?P<second>\d+))?\s*"
+    r"(?P<unit>[A-Za-zµμ%°][\w/%µμ.^*°-]*)?"
+)
+# Units that mark a "Name: number unit" line as a measurement; words such as
+# "seconds" or "released" after a number do not. Time units only appear as
+# a denominator ("mL/min"), so "Timeout: 30 min" is not a measurement.
+_UNIT_ATOM = r"(?:%|[kmµμnp]?g|[mµμn]?mol|m?eq|[mµμ]?i?u|[mdµμ]?l|fl|cells|lakhs?|cumm|mill(?:ion)?s?|thou(?:sand)?s?|mmhg|bpm|cm|mm|x?10\^?\d+|°[cf])"
+_PER_ATOM = r"(?:" + _UNIT_ATOM + r"|min|hr?|day|s|m2|1\.73m2)"
+_LAB_UNIT = re.compile(rf"{_UNIT_ATOM}(?:/{_PER_ATOM})*", re.IGNORECASE)
+# Identifiers, dates and demographics that look like "Name: number" lines
+_NOT_LAB_NAME = re.compile(
+    r"\b(?:id|no|number|date|dob|age|year|time|ref|mrn|phone|code|version)\b", re.IGNORECASE
+)
+_FLAG = re.compile(r"\b(low|normal|high|borderline)\b", re.IGNORECASE)
+_BULLET = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+")
+_SOURCE_OUTLINE = re.compile(
+    r"^(?:async\s+)?(?:def|class)\s+(\w+)"
+    r"|^(?:export\s+(?:default\s+)?)?(?:function|class)\s+(\w+)"
+    r"|^(?:export\s+)?const\s+(\w+)\s*=\s*(?:async\s*)?\("
+    r"|^([.#]?[\w-]+(?:[ ,:>.#][\w-]+)*)\s*\{"
+)
+
+
+def _clean(line: str) -> str:
+    return _BULLET.sub("", line).replace("**", "").replace("__", "").strip()
+
+
+def _sections(text: str) -> dict:
+    """Split markdown into {normalized heading: lines}; text before any heading goes under ''."""
+    sections = {"": []}
+    current = ""
+    for line in text.splitlines():
+        if line.lstrip().startswith("#"):
+            # Headings carry emoji in analyze_report_* output; keep only the words
+            current = " ".join(re.findall(r"[a-z]+", line.lower()))
+            sections.setdefault(current, [])
+        elif line.strip():
+            sections[current].append(line)
+    return sections
+
+
+def _section(sections: dict, keyword: str) -> List[str]:
+    for heading, lines in sections.items():
+        if keyword in heading:
+            return lines
+    return []
+
+
+def parse_lab_values(line: str) -> List[dict]:
+    """Lab values on one line: usually one, two for a blood pressure reading."""
+    cleaned = _clean(line)
+    match = _LAB_LINE.match(cleaned)
+    if not match:
+        return []
+    name = match.group("name").strip()
+    unit = match.group("unit")
+    unit = unit if unit and _LAB_UNIT.fullmatch(unit) else None
+    rest = cleaned[match.end("second") if match.group("second") else match.end("value"):]
+    # "2024-01-05", "10:30" and "12/03" are dates and times, not values
+    if _NOT_LAB_NAME.search(name) or re.match(r"[-/:.]\d", rest):
+        return []
+    if match.group("second") and (unit or "").lower() != "mmhg":
+        return []
+
+    flag = _FLAG.search(rest)
+    lab = {"unit": unit, "flag": flag.group(1).capitalize() if flag else None}
+    value = float(match.group("value").lstrip("<>"))
+    if match.group("second"):
+        return [
+            dict(lab, name=f"{name} systolic", value=value),
+            dict(lab, name=f"{name} diastolic", value=float(match.group("second"))),
+        ]
+    return [dict(lab, name=name, value=value)]
+
+
+def _summarize(lines: List[str]) -> str:
+    summary = " ".join(" ".join(_clean(line).split()) for line in lines if _clean(line))
+    if len(summary) > MAX_SUMMARY_CHARS:
+        summary = summary[:MAX_SUMMARY_CHARS].rsplit(" ", 1)[0] + "…"
+    return summary
+
+
+def build_digest(filename: str, text: str) -> dict:
+    """Summary, key findings and numeric lab values extracted from an attachment's text."""
+    text = text or ""
+    if filename.endswith(SOURCE_EXTENSIONS):
+        outline = []
+        for line in text.splitlines():
+            match = _SOURCE_OUTLINE.match(line)
+            if match:
+                outline.append(next(name for name in match.groups() if name))
+        return {
+            "summary": f"Source file, {len(text.splitlines())} lines.",
+            "findings": outline[:MAX_OUTLINE],
+            "lab_values": [],
+        }
+
+    sections = _sections(text)
+    summary_lines = _section(sections, "summary") or sections[""] or [line for lines in sections.values() for line in lines]
+
+    lab_values = []
+    lab_lines = set()
+    findings = []
+    report_like = bool(_section(sections, "finding")) or any(keyword in text.lower() for keyword in REPORT_KEYWORDS)
+    if report_like:
+        # The Key Findings section of analyze_report_* output lists values.
+        # Elsewhere a line needs a unit or a flag, and the text as a whole
+        # needs a clinical unit or flag: a lone "Growth: 12 %" in meeting
+        # notes that mention a report is not a lab result.
+        candidates = [
+            ("finding" in heading, line, parse_lab_values(line))
+            for heading, lines in sections.items() for line in lines
+        ]
+        clinical = any(
+            lab["flag"] or (lab["unit"] and lab["unit"] != "%")
+            for _, _, labs in candidates for lab in labs
+        )
+        for in_findings, line, labs in candidates:
+            if labs and (in_findings or (clinical and (labs[0]["unit"] or labs[0]["flag"]))):
+                lab_values += labs
+                lab_lines.add(line)
+        # Lab value lines are already captured as structured rows
+        summary_lines = [line for line in summary_lines if line not in lab_lines]
+        for heading, prefix in (("finding", ""), ("risk", "Risk: "), ("severity", "Severity: ")):
+            for line in _section(sections, heading):
+                if line not in lab_lines and _clean(line):
+                    findings.append(prefix + _clean(line))
+
+    return {
+        "summary": _summarize(summary_lines),
+        "findings": findings[:MAX_FINDINGS],
+        "lab_values": lab_values,
+    }
+
+
+def format_digest(filename: str, digest: dict) -> str:
+    lines = [f"[{filename}]"]
+    if digest["summary"]:
+        lines.append(f"Summary: {digest['summary']}")
+    if digest["findings"]:
+        lines.append("Key findings:")
+        lines += [f"- {finding}" for finding in digest["findings"]]
+    if digest["lab_values"]:
+        lines.append("Lab values:")
+        for lab in digest["lab_values"]:
+            value = f"{lab['value']:g}" + (f" {lab['unit']}" if lab["unit"] else "")
+            lines.append(f"- {lab['name']}: {value}" + (f" ({lab['flag']})" if lab["flag"] else ""))
+    return "\n".join(lines)
+
+
+def apply_digest(attachment: models.Attachment, text: str):
+    """Store the digest and lab value rows for an attachment whose text was just extracted."""
+    digest = build_digest(attachment.filename or "", text)
+    attachment.digest = format_digest(attachment.filename or "", digest)
+    attachment.lab_values = [
+        models.LabValue(conversation_id=attachment.conversation_id, **lab)
+        for lab in digest["lab_values"]
+    ]
+
+
+def context_for_message(db: Session, conversation_id: int, message: str) -> str:
+    """Digests of every attachment, plus raw passages for question words they don't cover."""
+    attachments = db.query(models.Attachment.digest).filter(
+        models.Attachment.conversation_id == conversation_id,
+        models.Attachment.digest.isnot(None)
+    ).order_by(models.Attachment.id).all()
+    if not attachments:
+        return ""
+    context = "\n\n".join(att.digest for att in attachments)
+
+    covered = context.lower()
+    missing = [word for word in dict.fromkeys(re.findall(r"\w+", message.lower()))
+               if len(word) > 3 and word not in covered]
+    if missing and database.is_sqlite:
+        passages = search.attachment_passages(db, conversation_id, missing, MAX_PASSAGES, PASSAGE_TOKENS)
+        if passages:
+            context += "\n\nRelevant passages:\n" + "\n".join(f"[{p['filename']}] {p['passage']}" for p in passages)
+    return context
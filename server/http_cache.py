@@ -0,0 +1,58 @@
+"""Conditional GET helpers: ETag / Last-Modified validators and 304 responses."""
+import datetime
+import hashlib
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response
+
+
+def make_etag(*parts) -> str:
+    # Weak, because the gzip middleware may change the bytes of an equivalent body
+    digest = hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def _strip_weak(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def _second_is_over(last_modified: datetime.datetime) -> bool:
+    # HTTP dates have one-second resolution: while the second of the last
+    # write is still running, another write could land in it unnoticed
+    return last_modified.replace(microsecond=0) < datetime.datetime.utcnow().replace(microsecond=0)
+
+
+def cache_headers(etag: str, last_modified: Optional[datetime.datetime] = None) -> dict:
+    # no-cache: clients may store the response but must revalidate it each time
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    # Last-Modified is only sent once it can no longer change within its second
+    if last_modified is not None and _second_is_over(last_modified):
+        headers["Last-Modified"] = format_datetime(last_modified.replace(tzinfo=datetime.timezone.utc), usegmt=True)
+    return headers
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime.datetime] = None) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match takes precedence over If-Modified-Since
+        if if_none_match.strip() == "*":
+            return True
+        return _strip_weak(etag) in {_strip_weak(tag) for tag in if_none_match.split(",")}
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None and _second_is_over(last_modified):
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=datetime.timezone.utc)
+        modified = last_modified.replace(tzinfo=datetime.timezone.utc, microsecond=0)
+        return modified <= since
+    return False
+
+
+def not_modified(headers: dict) -> Response:
+    return Response(status_code=304, headers=headers)
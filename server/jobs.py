@@ -0,0 +1,192 @@
+import datetime
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import database
+import digests
+import gemini_utils
+import models
+
+# Analysis is dominated by Gemini round-trips, so threads mostly wait on I/O.
+# The default matches MAX_BATCH_FILES in main.py so a full batch finishes in
+# about the time of its slowest file; lower it if the Gemini quota is tight,
+# at the cost of batches taking several analysis rounds.
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "50"))
+# A job still running after this long is assumed lost with a crashed worker
+# and goes back in the queue; claiming is atomic, so at worst it runs twice.
+ANALYSIS_JOB_TIMEOUT_SECONDS = int(os.getenv("ANALYSIS_JOB_TIMEOUT_SECONDS", "900"))
+REAP_INTERVAL_SECONDS = 60
+
+TEXT_EXTENSIONS = ('.txt', '.md', '.py', '.js', '.jsx', '.css')
+
+_executor = None
+_executor_lock = threading.Lock()
+_stop_event = threading.Event()
+_reaper = None
+
+
+def analyze_upload(content: bytes, content_type: str, filename: str) -> str:
+    """Turn an uploaded file into the text stored on its Attachment."""
+    # If it's an image, use Gemini Image Analysis
+    if (content_type or "").startswith("image/"):
+        image_analysis = gemini_utils.analyze_report_image(content, content_type)
+        return f"[Image Analysis Result]\n{image_analysis}"
+
+    if filename.endswith(TEXT_EXTENSIONS):
+        text_content = content.decode("utf-8")
+        # Check if it looks like a medical report to suggest analysis
+        if any(keyword in text_content.lower() for keyword in digests.REPORT_KEYWORDS):
+            text_content = gemini_utils.analyze_report_text(text_content)
+        return text_content
+
+    return "[Binary/Unsupported file content - Name: " + filename + "]"
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS, thread_name_prefix="analysis")
+        return _executor
+
+
+def _log_job_error(job_id: int, future):
+    # Executor futures swallow exceptions that nothing waits on
+    if not future.cancelled() and future.exception() is not None:
+        print(f"Analysis job {job_id} crashed: {future.exception()}")
+
+
+def enqueue(job_id: int):
+    future = _get_executor().submit(run_job, job_id)
+    future.add_done_callback(lambda f: _log_job_error(job_id, f))
+
+
+def run_job(job_id: int):
+    db = database.SessionLocal()
+    try:
+        # Claim the job atomically so it is never analyzed twice
+        claimed = db.query(models.AnalysisJob).filter(
+            models.AnalysisJob.id == job_id,
+            models.AnalysisJob.status == "queued"
+        ).update({"status": "running", "started_at": datetime.datetime.utcnow()}, synchronize_session=False)
+        db.commit()
+        if not claimed:
+            return
+
+        try:
+            _finish_job(db, job_id)
+        except Exception as e:
+            # Never leave a claimed job running: its progress stream would not end
+            print(f"Analysis job {job_id} could not be completed: {e}")
+            db.rollback()
+            db.query(models.AnalysisJob).filter(models.AnalysisJob.id == job_id).update({
+                "status": "failed",
+                "error": str(e),
+                "payload": None,
+                "finished_at": datetime.datetime.utcnow(),
+            }, synchronize_session=False)
+            db.commit()
+    finally:
+        db.close()
+
+
+def _finish_job(db, job_id: int):
+    job = db.query(models.AnalysisJob).filter(models.AnalysisJob.id == job_id).first()
+    try:
+        text_content = analyze_upload(job.payload or b"", job.content_type, job.filename)
+        job.status = "done"
+    except Exception as e:
+        print(f"Analysis job {job_id} failed: {e}")
+        text_content = "[Analysis failed - Name: " + job.filename + "]"
+        job.status = "failed"
+        job.error = str(e)
+
+    if job.attachment is not None:
+        job.attachment.content = text_content
+        digests.apply_digest(job.attachment, text_content)
+    job.payload = None
+    job.finished_at = datetime.datetime.utcnow()
+    db.commit()
+
+
+def requeue_interrupted(older_than_seconds: Optional[float] = None) -> List[int]:
+    """Put jobs left running by a previous process back in the queue.
+
+    Without a cutoff every running job is requeued, which is only safe while
+    no other process is analyzing; the multi-worker launcher does that once
+    before starting its workers. With a cutoff only jobs started before it
+    are requeued. Returns the requeued ids.
+    """
+    db = database.SessionLocal()
+    try:
+        running = db.query(models.AnalysisJob.id).filter(models.AnalysisJob.status == "running")
+        if older_than_seconds is not None:
+            cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=older_than_seconds)
+            running = running.filter(models.AnalysisJob.started_at < cutoff)
+        job_ids = [job_id for (job_id,) in running.all()]
+        if job_ids:
+            # Same conditions again: a job may have finished since the select
+            requeued = db.query(models.AnalysisJob).filter(
+                models.AnalysisJob.id.in_(job_ids),
+                models.AnalysisJob.status == "running"
+            )
+            if older_than_seconds is not None:
+                requeued = requeued.filter(models.AnalysisJob.started_at < cutoff)
+            requeued.update({"status": "queued", "started_at": None}, synchronize_session=False)
+            db.commit()
+        return job_ids
+    finally:
+        db.close()
+
+
+def _reap_loop():
+    while not _stop_event.wait(REAP_INTERVAL_SECONDS):
+        try:
+            stale = requeue_interrupted(ANALYSIS_JOB_TIMEOUT_SECONDS)
+        except Exception as e:
+            print(f"Reclaiming stale analysis jobs failed: {e}")
+            continue
+        if stale:
+            print(f"Requeued {len(stale)} stale analysis jobs")
+        # Any worker may pick them up; the atomic claim stops a second run
+        for job_id in stale:
+            enqueue(job_id)
+
+
+def resume_pending():
+    """Submit queued jobs, including ones interrupted mid-run by a restart."""
+    global _reaper
+    # Under the multi-worker launcher sibling workers may be mid-job, and the
+    # interrupted jobs were already requeued before any worker started. Jobs
+    # lost later, when a single worker crashes and is restarted, are picked up
+    # by the reaper once they pass the timeout.
+    if not os.getenv("DATABASE_PREPARED"):
+        requeue_interrupted()
+
+    db = database.SessionLocal()
+    try:
+        pending = db.query(models.AnalysisJob.id).filter(models.AnalysisJob.status == "queued").order_by(models.AnalysisJob.id).all()
+    finally:
+        db.close()
+
+    if pending:
+        print(f"Resuming {len(pending)} pending analysis jobs")
+    for (job_id,) in pending:
+        enqueue(job_id)
+
+    if _reaper is None:
+        _stop_event.clear()
+        _reaper = threading.Thread(target=_reap_loop, name="analysis-reaper", daemon=True)
+        _reaper.start()
+
+
+def shutdown():
+    global _executor, _reaper
+    _stop_event.set()
+    _reaper = None
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
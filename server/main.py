@@ -1,20 +1,37 @@
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Request
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Request, Query, Response
 
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session, selectinload, undefer
 from typing import List, Optional
 import models, schemas, database
+import asyncio
 import os
 import sqlalchemy as sa
 import time
-from collections import defaultdict
+import json
+import datetime
+import digests
 import gemini_utils
+import http_cache
+import jobs
+import migrations
+import retention
+import search
+import state
+import transfer
 
 
 
 
-# Create tables
-models.Base.metadata.create_all(bind=database.engine)
+# Create tables; under serve.py the launcher has already done this once,
+# so its workers don't race each other through the migrations
+if not os.getenv("DATABASE_PREPARED"):
+    models.Base.metadata.create_all(bind=database.engine)
+    migrations.run_migrations(database.engine)
 
 app = FastAPI(title="Gen AI API")
 
@@ -26,6 +43,18 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Compress larger JSON bodies (conversation lists, exports) for clients that accept gzip
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=6)
+
+@app.on_event("startup")
+def start_background_work():
+    jobs.resume_pending()
+    retention.start()
+
+@app.on_event("shutdown")
+def stop_background_work():
+    jobs.shutdown()
+    retention.stop()
 
 # Dependency
 def get_db():
@@ -94,20 +123,12 @@ def get_ai_response(message: str, model: str = "aura-standard", context: str = "
 
 
 # --- Rate Limiter ---
-user_request_counts = defaultdict(list)
+# Windows live in the shared state store so every worker process enforces the same limit
 RATE_LIMIT_SECONDS = 60
 MAX_REQUESTS = 10
 
 def check_rate_limit(user_ip: str):
-    now = time.time()
-    # Filter out timestamps older than current window
-    user_request_counts[user_ip] = [t for t in user_request_counts[user_ip] if now - t < RATE_LIMIT_SECONDS]
-    
-    if len(user_request_counts[user_ip]) >= MAX_REQUESTS:
-        return False
-    
-    user_request_counts[user_ip].append(now)
-    return True
+    return state.store.hit(f"rate:{user_ip}", RATE_LIMIT_SECONDS, MAX_REQUESTS)
 
 
 
@@ -137,14 +158,69 @@ def create_conversation(conversation: schemas.ConversationCreate, db: Session =
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Responses include message text but only attachment filenames, so leave
+# Attachment.content deferred and batch-load the rest instead of N+1 lazy loads
+CONVERSATION_LOAD_OPTIONS = (
+    selectinload(models.Conversation.messages).undefer(models.Message.content),
+    selectinload(models.Conversation.messages).selectinload(models.Message.feedback),
+    selectinload(models.Conversation.attachments),
+)
+
+def conversation_versions(db: Session, conversation_id: Optional[int] = None):
+    """Indexed aggregates that change whenever a conversation response would.
+
+    Returns (count, version tuple, last modified). Messages and feedback are
+    only deleted together with their conversation, so high-water marks of
+    the child ids plus the conversation count and updated_at cover every write.
+    """
+    def scoped(column, key):
+        query = db.query(column)
+        if conversation_id is not None:
+            query = query.filter(key == conversation_id)
+        return query.scalar_subquery()
+
+    C, M, A, F = models.Conversation, models.Message, models.Attachment, models.Feedback
+    columns = [
+        scoped(sa.func.count(C.id), C.id),
+        scoped(sa.func.max(C.id), C.id),
+        scoped(sa.func.max(C.updated_at), C.id),
+        scoped(sa.func.max(M.id), M.conversation_id),
+        scoped(sa.func.max(A.id), A.conversation_id),
+        scoped(sa.func.max(F.id), F.conversation_id),
+    ]
+    if conversation_id is not None:
+        # Cheap within one conversation; a timestamp for the whole table would need a scan
+        columns += [scoped(sa.func.max(A.created_at), A.conversation_id), scoped(sa.func.max(F.created_at), F.conversation_id)]
+    row = tuple(db.query(*columns).one())
+
+    last_modified = None
+    if conversation_id is not None:
+        timestamps = [t for t in (row[2], row[6], row[7]) if t is not None]
+        last_modified = max(timestamps) if timestamps else None
+    return row[0], row[:6], last_modified
+
 @app.get("/conversations", response_model=List[schemas.Conversation])
-def read_conversations(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    conversations = db.query(models.Conversation).order_by(models.Conversation.updated_at.desc()).offset(skip).limit(limit).all()
+def read_conversations(request: Request, response: Response, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    _, version, _ = conversation_versions(db)
+    headers = http_cache.cache_headers(http_cache.make_etag("conversations", skip, limit, version))
+    if http_cache.is_not_modified(request, headers["ETag"]):
+        return http_cache.not_modified(headers)
+    response.headers.update(headers)
+
+    conversations = db.query(models.Conversation).options(*CONVERSATION_LOAD_OPTIONS).order_by(models.Conversation.updated_at.desc()).offset(skip).limit(limit).all()
     return conversations
 
 @app.get("/conversations/{conversation_id}", response_model=schemas.Conversation)
-def read_conversation(conversation_id: int, db: Session = Depends(get_db)):
-    conversation = db.query(models.Conversation).filter(models.Conversation.id == conversation_id).first()
+def read_conversation(conversation_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
+    count, version, last_modified = conversation_versions(db, conversation_id)
+    if count == 0:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    headers = http_cache.cache_headers(http_cache.make_etag("conversation", version), last_modified)
+    if http_cache.is_not_modified(request, headers["ETag"], last_modified):
+        return http_cache.not_modified(headers)
+    response.headers.update(headers)
+
+    conversation = db.query(models.Conversation).options(*CONVERSATION_LOAD_OPTIONS).filter(models.Conversation.id == conversation_id).first()
     if conversation is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
     return conversation
@@ -168,15 +244,42 @@ def delete_conversation(conversation_id: int, db: Session = Depends(get_db)):
     db_conversation = db.query(models.Conversation).filter(models.Conversation.id == conversation_id).first()
     if not db_conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
-    
-    # Delete associated messages and attachments first
-    db.query(models.Message).filter(models.Message.conversation_id == conversation_id).delete()
-    db.query(models.Attachment).filter(models.Attachment.conversation_id == conversation_id).delete()
-    
+
+    # Messages, attachments, feedback and jobs go with it via ON DELETE CASCADE
     db.delete(db_conversation)
     db.commit()
     return {"message": "Conversation deleted"}
 
+@app.post("/conversations/bulk-delete", response_model=schemas.BulkConversationResult)
+def bulk_delete_conversations(action: schemas.BulkConversationAction, db: Session = Depends(get_db)):
+    conversation_ids = sorted(set(action.conversation_ids))
+    if action.archive:
+        archived = retention.archive_conversations(db, conversation_ids)
+        return {"deleted": archived, "archived": archived}
+    return {"deleted": retention.delete_conversations(db, conversation_ids), "archived": 0}
+
+@app.get("/export")
+def export_conversations(conversation_ids: Optional[List[int]] = Query(None), compress: bool = False):
+    filename = "conversations.ndjson.gz" if compress else "conversations.ndjson"
+    return StreamingResponse(
+        transfer.export_ndjson(conversation_ids, compress=compress),
+        media_type="application/gzip" if compress else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.post("/import", response_model=schemas.ImportResult)
+def import_conversations(file: UploadFile = File(...), resume_after_line: int = Query(0, ge=0), atomic: bool = False):
+    # Plain def: the upload is already spooled to disk, and the batched
+    # inserts run in the threadpool instead of blocking the event loop.
+    try:
+        return transfer.import_ndjson(file.file, resume_after_line=resume_after_line, atomic=atomic)
+    except transfer.ImportFailed as e:
+        raise HTTPException(status_code=400, detail={"message": str(e), "committed_line": e.committed_line})
+
+@app.post("/maintenance/retention")
+def run_retention_now(days: int = Query(..., ge=1)):
+    return retention.run_retention(days)
+
 @app.post("/upload", response_model=schemas.Attachment)
 async def upload_file(conversation_id: int, file: UploadFile = File(...), db: Session = Depends(get_db)):
     # Verify conversation exists
@@ -185,31 +288,108 @@ async def upload_file(conversation_id: int, file: UploadFile = File(...), db: Se
         raise HTTPException(status_code=404, detail="Conversation not found")
 
     content = await file.read()
-    text_content = ""
-    
-    # If it's an image, use Gemini Image Analysis
-    image_analysis = ""
-    if file.content_type.startswith("image/"):
-        image_analysis = gemini_utils.analyze_report_image(content, file.content_type)
-        text_content = f"[Image Analysis Result]\n{image_analysis}"
-    elif file.filename.endswith(('.txt', '.md', '.py', '.js', '.jsx', '.css')):
-        text_content = content.decode("utf-8")
-        # Check if it looks like a medical report to suggest analysis
-        if any(keyword in text_content.lower() for keyword in ["blood", "test", "report", "lab", "result"]):
-            text_content = gemini_utils.analyze_report_text(text_content)
-    else:
-        text_content = "[Binary/Unsupported file content - Name: " + file.filename + "]"
+    text_content = jobs.analyze_upload(content, file.content_type, file.filename)
 
     db_attachment = models.Attachment(
         conversation_id=conversation_id,
         filename=file.filename,
         content=text_content
     )
+    digests.apply_digest(db_attachment, text_content)
     db.add(db_attachment)
     db.commit()
     db.refresh(db_attachment)
     return db_attachment
 
+MAX_BATCH_FILES = 50
+JOB_POLL_INTERVAL = 0.5
+JOB_STREAM_MAX_SECONDS = int(os.getenv("JOB_STREAM_MAX_SECONDS", "600"))
+
+@app.post("/upload/batch", response_model=List[schemas.AnalysisJob], status_code=202)
+async def upload_files(conversation_id: int, files: List[UploadFile] = File(...), db: Session = Depends(get_db)):
+    if len(files) > MAX_BATCH_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_FILES} files per batch.")
+    uploads = [(file.filename, file.content_type, await file.read()) for file in files]
+
+    def store_jobs():
+        conversation = db.query(models.Conversation).filter(models.Conversation.id == conversation_id).first()
+        if not conversation:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+
+        # Store every file right away; analysis happens in the background worker pool
+        db_jobs = []
+        for filename, content_type, payload in uploads:
+            db_attachment = models.Attachment(conversation_id=conversation_id, filename=filename, content="")
+            db_job = models.AnalysisJob(
+                conversation_id=conversation_id,
+                attachment=db_attachment,
+                filename=filename,
+                content_type=content_type,
+                payload=payload,
+                status="queued"
+            )
+            db.add(db_job)
+            db_jobs.append(db_job)
+        db.commit()
+        for db_job in db_jobs:
+            db.refresh(db_job) # Load here so serializing the response doesn't query on the event loop
+        return db_jobs
+
+    # Inserting the payload BLOBs is blocking work; keep it off the event loop
+    db_jobs = await run_in_threadpool(store_jobs)
+    for db_job in db_jobs:
+        jobs.enqueue(db_job.id)
+    return db_jobs
+
+@app.get("/jobs/events")
+def stream_jobs(ids: List[int] = Query(...)):
+    """Server-sent events with job status changes until every job has finished."""
+    def poll_jobs():
+        db = database.SessionLocal()
+        try:
+            return [{
+                "id": db_job.id,
+                "attachment_id": db_job.attachment_id,
+                "filename": db_job.filename,
+                "status": db_job.status,
+                "error": db_job.error,
+                "finished_at": db_job.finished_at,
+            } for db_job in db.query(models.AnalysisJob).filter(models.AnalysisJob.id.in_(ids)).all()]
+        finally:
+            db.close()
+
+    async def event_stream():
+        # Async so a waiting stream holds no threadpool thread; only the
+        # short DB poll runs there.
+        deadline = time.monotonic() + JOB_STREAM_MAX_SECONDS
+        last_status = {}
+        while True:
+            db_jobs = await run_in_threadpool(poll_jobs)
+            for db_job in db_jobs:
+                if last_status.get(db_job["id"]) != db_job["status"]:
+                    last_status[db_job["id"]] = db_job["status"]
+                    yield f"data: {json.dumps(jsonable_encoder(db_job))}\n\n"
+            if all(db_job["status"] in ("done", "failed") for db_job in db_jobs):
+                break
+            if time.monotonic() >= deadline:
+                # Clients fall back to polling /jobs/{id} for anything still running
+                yield "event: timeout\ndata: {}\n\n"
+                break
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+@app.get("/jobs/{job_id}", response_model=schemas.AnalysisJob)
+def read_job(job_id: int, db: Session = Depends(get_db)):
+    db_job = db.query(models.AnalysisJob).filter(models.AnalysisJob.id == job_id).first()
+    if db_job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return db_job
+
+@app.get("/conversations/{conversation_id}/jobs", response_model=List[schemas.AnalysisJob])
+def read_conversation_jobs(conversation_id: int, db: Session = Depends(get_db)):
+    return db.query(models.AnalysisJob).filter(models.AnalysisJob.conversation_id == conversation_id).order_by(models.AnalysisJob.id).all()
+
 
 @app.post("/conversations/{conversation_id}/messages", response_model=schemas.Message)
 def create_message(conversation_id: int, message: schemas.MessageCreate, request: Request, db: Session = Depends(get_db)):
@@ -231,9 +411,8 @@ def create_message(conversation_id: int, message: schemas.MessageCreate, request
     db.add(db_user_message)
     db.commit()
 
-    # 2. Gather context from attachments (Simple RAG)
-    attachments = db.query(models.Attachment).filter(models.Attachment.conversation_id == conversation_id).all()
-    context = "\n".join([att.content for att in attachments]) if attachments else ""
+    # 2. Gather context from attachment digests, plus raw passages only where they fall short (Simple RAG)
+    context = digests.context_for_message(db, conversation_id, message.content)
 
     # 3. Get AI Response with model selection and context
     ai_response_content = get_ai_response(
@@ -255,13 +434,26 @@ def create_message(conversation_id: int, message: schemas.MessageCreate, request
     )
     db.add(metric)
 
-    # Updated_at is handled by the model's onupdate
+    # New messages don't touch the conversation row, so bump updated_at explicitly
+    conversation.updated_at = datetime.datetime.utcnow()
     db.commit()
 
     db.refresh(db_ai_message)
     
     return db_ai_message
 
+@app.get("/search", response_model=schemas.SearchResults)
+def search_history(
+    q: str,
+    conversation_id: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db)
+):
+    if database.engine.dialect.name != "sqlite":
+        raise HTTPException(status_code=501, detail="Search requires the SQLite FTS5 index.")
+    return search.search(db, q, conversation_id=conversation_id, limit=limit, offset=offset)
+
 @app.post("/feedback", response_model=schemas.Feedback)
 def create_feedback(feedback: schemas.FeedbackCreate, db: Session = Depends(get_db)):
     db_feedback = models.Feedback(**feedback.dict())
@@ -270,8 +462,36 @@ def create_feedback(feedback: schemas.FeedbackCreate, db: Session = Depends(get_
     db.refresh(db_feedback)
     return db_feedback
 
+ANALYTICS_CACHE_SECONDS = 600
+
 @app.get("/analytics", response_model=schemas.AnalyticsSummary)
-def get_analytics(db: Session = Depends(get_db)):
+def get_analytics(request: Request, response: Response, db: Session = Depends(get_db)):
+    # Rollup version: usage metrics and feedback are append-only, and messages
+    # only disappear with their conversation
+    C, M, F, U = models.Conversation, models.Message, models.Feedback, models.UsageMetric
+    version = tuple(db.query(
+        db.query(sa.func.count(C.id)).scalar_subquery(),
+        db.query(sa.func.max(C.id)).scalar_subquery(),
+        db.query(sa.func.max(M.id)).scalar_subquery(),
+        db.query(sa.func.max(F.id)).scalar_subquery(),
+        db.query(sa.func.max(U.id)).scalar_subquery(),
+    ).one())
+    headers = http_cache.cache_headers(http_cache.make_etag("analytics", version))
+    if http_cache.is_not_modified(request, headers["ETag"]):
+        return http_cache.not_modified(headers)
+    response.headers.update(headers)
+
+    # Other clients (and other workers) asking for the same version reuse the rollup
+    cache_key = "analytics:" + headers["ETag"]
+    cached = state.store.get(cache_key)
+    if cached is not None:
+        return json.loads(cached)
+
+    summary = compute_analytics(db)
+    state.store.set(cache_key, json.dumps(summary), ANALYTICS_CACHE_SECONDS)
+    return summary
+
+def compute_analytics(db: Session) -> dict:
     total_messages = db.query(models.Message).count()
     total_tokens = db.query(sa.func.sum(models.UsageMetric.token_count)).scalar() or 0
     positive_feedback = db.query(models.Feedback).filter(models.Feedback.is_positive == True).count()
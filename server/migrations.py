@@ -0,0 +1,199 @@
+"""Schema changes that create_all cannot express, tracked with PRAGMA user_version."""
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+import compression
+import digests
+import models
+
+
+# (table, indexed columns, columns stored with CompressedText)
+SEARCH_INDEXES = [
+    ("conversations", ["title"], []),
+    ("messages", ["content"], ["content"]),
+    ("attachments", ["filename", "content"], ["content"]),
+]
+
+
+def _fts_statements(table: str, columns: list, compressed: list) -> list:
+    fts = f"{table}_fts"
+    cols = ", ".join(columns)
+
+    def values(prefix):
+        return ", ".join(f"decompress_text({prefix}.{c})" if c in compressed else f"{prefix}.{c}" for c in columns)
+
+    statements = []
+    content = table
+    if compressed:
+        # FTS5 reads an external-content table back for snippets and rebuilds,
+        # so point it at a view that exposes the decompressed text
+        content = f"{fts}_source"
+        source_cols = ", ".join(f"decompress_text({c}) AS {c}" if c in compressed else c for c in columns)
+        statements.append(f"CREATE VIEW IF NOT EXISTS {content} AS SELECT id, {source_cols} FROM {table}")
+
+    statements += [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, content='{content}', content_rowid='id', tokenize='porter unicode61')",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+            INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {values("new")});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+            INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {values("old")});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN
+            INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {values("old")});
+            INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {values("new")});
+        END""",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+    return statements
+
+
+def _drop_search_index(conn):
+    for table, _, _ in SEARCH_INDEXES:
+        fts = f"{table}_fts"
+        for trigger in ("ai", "ad", "au"):
+            conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {fts}_{trigger}")
+        conn.exec_driver_sql(f"DROP TABLE IF EXISTS {fts}")
+        conn.exec_driver_sql(f"DROP VIEW IF EXISTS {fts}_source")
+
+
+def create_search_index(conn):
+    """Full-text search over conversations, messages and attachments"""
+    for table, columns, compressed in SEARCH_INDEXES:
+        for statement in _fts_statements(table, columns, compressed):
+            conn.exec_driver_sql(statement)
+
+
+def _rebuild_table(conn, table_name: str):
+    """Recreate a table from its current model definition, keeping its rows.
+
+    SQLite cannot ALTER constraints, so this follows its documented
+    create-copy-drop-rename procedure. Rows whose cascading parent no longer
+    exists are dropped on the way.
+    """
+    table = models.Base.metadata.tables[table_name]
+    existing = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table_name})")}
+    columns = ", ".join(c.name for c in table.columns if c.name in existing)
+
+    conditions = []
+    for fk in table.foreign_keys:
+        if fk.ondelete == "CASCADE":
+            parent = fk.column.table.name
+            col = fk.parent.name
+            conditions.append(f"({col} IS NULL OR {col} IN (SELECT {fk.column.name} FROM {parent}))")
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
+
+    create_sql = str(CreateTable(table).compile(dialect=conn.dialect))
+    conn.exec_driver_sql(create_sql.replace(f"CREATE TABLE {table_name} ", f"CREATE TABLE {table_name}_new ", 1))
+    conn.exec_driver_sql(f"INSERT INTO {table_name}_new ({columns}) SELECT {columns} FROM {table_name}{where}")
+    conn.exec_driver_sql(f"DROP TABLE {table_name}")
+    conn.exec_driver_sql(f"ALTER TABLE {table_name}_new RENAME TO {table_name}")
+    for index in table.indexes:
+        conn.exec_driver_sql(str(CreateIndex(index).compile(dialect=conn.dialect)))
+
+
+def add_cascading_deletes(conn):
+    """ON DELETE CASCADE from conversations to their messages, attachments, feedback and jobs"""
+    # The search index's views and triggers reference the tables being replaced
+    _drop_search_index(conn)
+    # Parents before children so orphan filtering sees the cleaned parent tables
+    for table_name in ("attachments", "messages", "feedbacks", "analysis_jobs"):
+        _rebuild_table(conn, table_name)
+    create_search_index(conn)
+
+
+def compress_large_text(conn):
+    """Compress existing message and attachment text above the size threshold"""
+    # The old index read the raw columns; drop it before touching them and
+    # rebuild it over the decompressing views afterwards.
+    _drop_search_index(conn)
+    for table, column in (("messages", "content"), ("attachments", "content")):
+        ids = [row[0] for row in conn.exec_driver_sql(
+            f"SELECT id FROM {table} WHERE typeof({column}) = 'text' AND length(CAST({column} AS BLOB)) >= ?",
+            (compression.COMPRESSION_THRESHOLD,)
+        )]
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            placeholders = ", ".join("?" for _ in batch)
+            rows = conn.exec_driver_sql(f"SELECT id, {column} FROM {table} WHERE id IN ({placeholders})", tuple(batch)).all()
+            conn.exec_driver_sql(
+                f"UPDATE {table} SET {column} = ? WHERE id = ?",
+                [(compression.encode_text(value), row_id) for row_id, value in rows]
+            )
+    create_search_index(conn)
+
+
+def index_conversation_updated_at(conn):
+    """Index conversations.updated_at for list ordering and cache validators"""
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_conversations_updated_at ON conversations (updated_at)")
+
+
+def add_attachment_digests(conn):
+    """Digest column on attachments, backfilled along with their lab values"""
+    existing = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(attachments)")}
+    if "digest" not in existing:
+        conn.exec_driver_sql("ALTER TABLE attachments ADD COLUMN digest TEXT")
+
+    ids = [row[0] for row in conn.exec_driver_sql("SELECT id FROM attachments WHERE digest IS NULL")]
+    for start in range(0, len(ids), 500):
+        batch = ids[start:start + 500]
+        placeholders = ", ".join("?" for _ in batch)
+        rows = conn.exec_driver_sql(
+            f"SELECT id, conversation_id, filename, content FROM attachments WHERE id IN ({placeholders})", tuple(batch)
+        ).all()
+        for attachment_id, conversation_id, filename, content in rows:
+            digest = digests.build_digest(filename or "", compression.decode_text(content))
+            conn.exec_driver_sql(
+                "UPDATE attachments SET digest = ? WHERE id = ?",
+                (digests.format_digest(filename or "", digest), attachment_id)
+            )
+            if digest["lab_values"]:
+                conn.exec_driver_sql(
+                    "INSERT INTO lab_values (attachment_id, conversation_id, name, value, unit, flag) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(attachment_id, conversation_id, lab["name"], lab["value"], lab["unit"], lab["flag"]) for lab in digest["lab_values"]]
+                )
+
+
+MIGRATIONS = [
+    create_search_index,
+    add_cascading_deletes,
+    compress_large_text,
+    index_conversation_updated_at,
+    add_attachment_digests,
+]
+
+
+def _enable_incremental_vacuum(conn):
+    # auto_vacuum can only be switched on an existing database by a full VACUUM
+    if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+        print("Enabling incremental vacuum (one-time VACUUM)")
+        conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.exec_driver_sql("VACUUM")
+
+
+def run_migrations(engine):
+    if engine.dialect.name != "sqlite":
+        return
+
+    # Manage transactions by hand: foreign keys must be off while tables are
+    # rebuilt, and that pragma cannot change inside a transaction.
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("PRAGMA foreign_keys = OFF")
+        try:
+            version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+            for number, step in enumerate(MIGRATIONS, start=1):
+                if number <= version:
+                    continue
+                print(f"Applying migration {number}: {step.__doc__}")
+                conn.exec_driver_sql("BEGIN")
+                try:
+                    step(conn)
+                    if conn.exec_driver_sql("PRAGMA foreign_key_check").first() is not None:
+                        raise RuntimeError(f"Migration {number} left foreign key violations")
+                    conn.exec_driver_sql(f"PRAGMA user_version = {number}")
+                    conn.exec_driver_sql("COMMIT")
+                except Exception:
+                    conn.exec_driver_sql("ROLLBACK")
+                    raise
+            _enable_incremental_vacuum(conn)
+        finally:
+            conn.exec_driver_sql("PRAGMA foreign_keys = ON")
@@ -1,8 +1,33 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Text
-from sqlalchemy.orm import relationship
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, Float, String, DateTime, Text, LargeBinary
+from sqlalchemy.orm import deferred, relationship
+from sqlalchemy.types import TypeDecorator
 from database import Base
+import compression
 import datetime
 
+class CompressedText(TypeDecorator):
+    """Text column that is stored zlib-compressed once it passes compression.COMPRESSION_THRESHOLD."""
+    impl = Text
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        # SQLite lets short values stay TEXT next to compressed BLOBs in one column
+        if dialect.name == "sqlite":
+            return dialect.type_descriptor(Text())
+        return dialect.type_descriptor(LargeBinary())
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        stored = compression.encode_text(value)
+        if isinstance(stored, str) and dialect.name != "sqlite":
+            return stored.encode("utf-8")
+        return stored
+
+    def process_result_value(self, value, dialect):
+        return compression.decode_text(value)
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -24,43 +49,79 @@ class Conversation(Base):
     temperature = Column(Text, default="0.7")
     selected_model = Column(String, default="aura-standard")
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow, index=True)
 
     owner = relationship("User", back_populates="conversations")
-    messages = relationship("Message", back_populates="conversation")
-    attachments = relationship("Attachment", back_populates="conversation")
-    feedbacks = relationship("Feedback", back_populates="conversation")
+    # Children are removed by ON DELETE CASCADE in the database
+    messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan", passive_deletes=True)
+    attachments = relationship("Attachment", back_populates="conversation", cascade="all, delete-orphan", passive_deletes=True)
+    feedbacks = relationship("Feedback", back_populates="conversation", cascade="all, delete-orphan", passive_deletes=True)
+    analysis_jobs = relationship("AnalysisJob", back_populates="conversation", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class Attachment(Base):
     __tablename__ = "attachments"
 
     id = Column(Integer, primary_key=True, index=True)
-    conversation_id = Column(Integer, ForeignKey("conversations.id"))
+    conversation_id = Column(Integer, ForeignKey("conversations.id", ondelete="CASCADE"), index=True)
     filename = Column(String)
-    content = Column(Text) # Extracted text
+    content = deferred(Column(CompressedText)) # Extracted text, only loaded when accessed
+    digest = deferred(Column(Text, nullable=True)) # Compact summary/findings/lab values used as prompt context
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
     conversation = relationship("Conversation", back_populates="attachments")
+    analysis_job = relationship("AnalysisJob", back_populates="attachment", uselist=False, cascade="all, delete-orphan", passive_deletes=True)
+    lab_values = relationship("LabValue", back_populates="attachment", cascade="all, delete-orphan", passive_deletes=True)
+
+class LabValue(Base):
+    __tablename__ = "lab_values"
+
+    id = Column(Integer, primary_key=True, index=True)
+    attachment_id = Column(Integer, ForeignKey("attachments.id", ondelete="CASCADE"), index=True)
+    conversation_id = Column(Integer, ForeignKey("conversations.id", ondelete="CASCADE"), index=True)
+    name = Column(String)
+    value = Column(Float)
+    unit = Column(String, nullable=True)
+    flag = Column(String, nullable=True) # Low, Normal, High or Borderline
+
+    attachment = relationship("Attachment", back_populates="lab_values")
+
+class AnalysisJob(Base):
+    __tablename__ = "analysis_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    conversation_id = Column(Integer, ForeignKey("conversations.id", ondelete="CASCADE"), index=True)
+    attachment_id = Column(Integer, ForeignKey("attachments.id", ondelete="CASCADE"), index=True)
+    filename = Column(String)
+    content_type = Column(String, nullable=True)
+    payload = Column(LargeBinary, nullable=True) # Raw upload, cleared once analyzed
+    status = Column(String, default="queued", index=True) # queued, running, done, failed
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    conversation = relationship("Conversation", back_populates="analysis_jobs")
+    attachment = relationship("Attachment", back_populates="analysis_job")
 
 class Message(Base):
     __tablename__ = "messages"
 
     id = Column(Integer, primary_key=True, index=True)
-    conversation_id = Column(Integer, ForeignKey("conversations.id"))
+    conversation_id = Column(Integer, ForeignKey("conversations.id", ondelete="CASCADE"), index=True)
     role = Column(String)  # 'user' or 'assistant'
-    content = Column(Text)
+    content = deferred(Column(CompressedText))
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
     conversation = relationship("Conversation", back_populates="messages")
-    feedback = relationship("Feedback", back_populates="message", uselist=False)
+    feedback = relationship("Feedback", back_populates="message", uselist=False, cascade="all, delete-orphan", passive_deletes=True)
 
 class Feedback(Base):
     __tablename__ = "feedbacks"
 
     id = Column(Integer, primary_key=True, index=True)
-    message_id = Column(Integer, ForeignKey("messages.id"))
-    conversation_id = Column(Integer, ForeignKey("conversations.id"))
+    message_id = Column(Integer, ForeignKey("messages.id", ondelete="CASCADE"), index=True)
+    conversation_id = Column(Integer, ForeignKey("conversations.id", ondelete="CASCADE"), index=True)
     is_positive = Column(Boolean) # True for Up, False for Down
     comment = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
@@ -68,6 +129,18 @@ class Feedback(Base):
     message = relationship("Message", back_populates="feedback")
     conversation = relationship("Conversation", back_populates="feedbacks")
 
+class ArchivedConversation(Base):
+    __tablename__ = "archived_conversations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    conversation_id = Column(Integer, index=True) # Id the conversation had while live
+    title = Column(String)
+    message_count = Column(Integer, default=0)
+    payload = Column(LargeBinary) # zlib-compressed JSON of the conversation and its children
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    archived_at = Column(DateTime, default=datetime.datetime.utcnow)
+
 class UsageMetric(Base):
     __tablename__ = "usage_metrics"
 
@@ -0,0 +1,153 @@
+import datetime
+import json
+import os
+import threading
+import zlib
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.orm import Session, selectinload
+
+import database
+import models
+import state
+
+# Conversations are deleted/archived in chunks, committing after each one, so
+# a large cleanup never holds the SQLite write lock for long.
+CHUNK_SIZE = 200
+
+# Background retention is off unless RETENTION_DAYS is set
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "0"))
+RETENTION_INTERVAL_HOURS = float(os.getenv("RETENTION_INTERVAL_HOURS", "24"))
+
+_stop_event = threading.Event()
+_thread = None
+
+
+def _chunks(ids: List[int]):
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start:start + CHUNK_SIZE]
+
+
+def serialize_conversation(conversation: models.Conversation) -> dict:
+    return jsonable_encoder({
+        "id": conversation.id,
+        "title": conversation.title,
+        "system_prompt": conversation.system_prompt,
+        "temperature": conversation.temperature,
+        "selected_model": conversation.selected_model,
+        "created_at": conversation.created_at,
+        "updated_at": conversation.updated_at,
+        "attachments": [
+            {"filename": a.filename, "content": a.content, "created_at": a.created_at}
+            for a in conversation.attachments
+        ],
+        "messages": [
+            {
+                "role": m.role,
+                "content": m.content,
+                "created_at": m.created_at,
+                "feedback": {
+                    "is_positive": m.feedback.is_positive,
+                    "comment": m.feedback.comment,
+                    "created_at": m.feedback.created_at,
+                } if m.feedback else None,
+            }
+            for m in conversation.messages
+        ],
+    })
+
+
+def delete_conversations(db: Session, conversation_ids: List[int]) -> int:
+    """Delete conversations in chunks; children go with them via ON DELETE CASCADE."""
+    deleted = 0
+    for chunk in _chunks(conversation_ids):
+        deleted += db.query(models.Conversation).filter(
+            models.Conversation.id.in_(chunk)
+        ).delete(synchronize_session=False)
+        db.commit()
+    return deleted
+
+
+def archive_conversations(db: Session, conversation_ids: List[int]) -> int:
+    """Move conversations into compressed archive rows, then delete them from the hot tables."""
+    archived = 0
+    for chunk in _chunks(conversation_ids):
+        conversations = db.query(models.Conversation).filter(models.Conversation.id.in_(chunk)).options(
+            selectinload(models.Conversation.attachments).undefer(models.Attachment.content),
+            selectinload(models.Conversation.messages).undefer(models.Message.content),
+            selectinload(models.Conversation.messages).selectinload(models.Message.feedback),
+        ).all()
+        for conversation in conversations:
+            payload = json.dumps(serialize_conversation(conversation)).encode("utf-8")
+            db.add(models.ArchivedConversation(
+                conversation_id=conversation.id,
+                title=conversation.title,
+                message_count=len(conversation.messages),
+                payload=zlib.compress(payload, 9),
+                created_at=conversation.created_at,
+                updated_at=conversation.updated_at,
+            ))
+        db.flush()
+        db.query(models.Conversation).filter(
+            models.Conversation.id.in_([c.id for c in conversations])
+        ).delete(synchronize_session=False)
+        db.commit()
+        db.expunge_all()
+        archived += len(conversations)
+    return archived
+
+
+def incremental_vacuum():
+    """Return free pages left behind by deletes to the filesystem."""
+    if database.engine.dialect.name != "sqlite":
+        return
+    # executescript steps the pragma to completion; a plain execute frees only one page
+    connection = database.engine.raw_connection()
+    try:
+        connection.cursor().executescript("PRAGMA incremental_vacuum;")
+    finally:
+        connection.close()
+
+
+def run_retention(days: int) -> dict:
+    """Archive conversations with no activity in the last `days` days."""
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+    db = database.SessionLocal()
+    try:
+        stale_ids = [conv_id for (conv_id,) in db.query(models.Conversation.id).filter(
+            models.Conversation.updated_at < cutoff
+        ).order_by(models.Conversation.id).all()]
+        archived = archive_conversations(db, stale_ids)
+    finally:
+        db.close()
+    incremental_vacuum()
+    return {"archived": archived}
+
+
+def _retention_loop():
+    interval = RETENTION_INTERVAL_HOURS * 3600
+    while not _stop_event.is_set():
+        # Every worker runs this loop; the lease lets only one of them do the work per interval
+        if state.store.acquire_lock("retention", state.WORKER_ID, interval):
+            try:
+                result = run_retention(RETENTION_DAYS)
+                print(f"Retention archived {result['archived']} conversations")
+            except Exception as e:
+                print(f"Retention job failed: {e}")
+        _stop_event.wait(interval)
+
+
+def start():
+    global _thread
+    if RETENTION_DAYS <= 0 or _thread is not None:
+        return
+    _stop_event.clear()
+    _thread = threading.Thread(target=_retention_loop, name="retention", daemon=True)
+    _thread.start()
+
+
+def stop():
+    global _thread
+    _stop_event.set()
+    _thread = None
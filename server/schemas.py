@@ -55,6 +55,36 @@ class Attachment(AttachmentBase):
     class Config:
         orm_mode = True
 
+class BulkConversationAction(BaseModel):
+    conversation_ids: List[int]
+    archive: bool = False # Keep a compressed copy instead of discarding
+
+class BulkConversationResult(BaseModel):
+    deleted: int
+    archived: int
+
+class ImportResult(BaseModel):
+    conversations: int
+    attachments: int
+    messages: int
+    feedbacks: int
+    last_line: int
+
+# --- Analysis Job Schemas ---
+class AnalysisJob(BaseModel):
+    id: int
+    conversation_id: int
+    attachment_id: int
+    filename: str
+    status: str
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
+
 # --- Conversation Schemas ---
 class ConversationBase(BaseModel):
     title: Optional[str] = "New Chat"
@@ -85,6 +115,20 @@ class Conversation(ConversationBase):
     class Config:
         orm_mode = True
 
+# --- Search Schemas ---
+class SearchResult(BaseModel):
+    kind: str # 'conversation', 'message' or 'attachment'
+    id: int
+    conversation_id: int
+    conversation_title: Optional[str] = None
+    snippet: str
+    rank: float
+
+class SearchResults(BaseModel):
+    query: str
+    results: List[SearchResult]
+    has_more: bool
+
 # --- Analytics Schemas ---
 class UsageMetric(BaseModel):
     id: int
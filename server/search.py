@@ -0,0 +1,118 @@
+import re
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+import models
+
+HIGHLIGHT_OPEN = "<mark>"
+HIGHLIGHT_CLOSE = "</mark>"
+SNIPPET_TOKENS = 16
+
+# One ranked sub-query per FTS table. Each is limited on its own so FTS5 can
+# use its ORDER BY rank optimisation before the results are merged.
+_SEARCH_SQL = """
+SELECT kind, id, conversation_id, snippet, rank FROM (
+    SELECT 'conversation' AS kind, c.id AS id, c.id AS conversation_id,
+           highlight(conversations_fts, 0, :open, :close) AS snippet, conversations_fts.rank AS rank
+    FROM conversations_fts JOIN conversations c ON c.id = conversations_fts.rowid
+    WHERE conversations_fts MATCH :query {conversation_filter_c}
+    ORDER BY rank LIMIT :window
+)
+UNION ALL
+SELECT kind, id, conversation_id, snippet, rank FROM (
+    SELECT 'message' AS kind, m.id AS id, m.conversation_id AS conversation_id,
+           snippet(messages_fts, 0, :open, :close, '…', :tokens) AS snippet, messages_fts.rank AS rank
+    FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid
+    WHERE messages_fts MATCH :query {conversation_filter_m}
+    ORDER BY rank LIMIT :window
+)
+UNION ALL
+SELECT kind, id, conversation_id, snippet, rank FROM (
+    SELECT 'attachment' AS kind, a.id AS id, a.conversation_id AS conversation_id,
+           snippet(attachments_fts, -1, :open, :close, '…', :tokens) AS snippet, attachments_fts.rank AS rank
+    FROM attachments_fts JOIN attachments a ON a.id = attachments_fts.rowid
+    WHERE attachments_fts MATCH :query {conversation_filter_a}
+    ORDER BY rank LIMIT :window
+)
+ORDER BY rank, kind, id LIMIT :limit OFFSET :offset
+"""
+
+
+def build_match_query(q: str) -> str:
+    """Turn free text into a safe FTS5 query: every word must match, the last one as a prefix."""
+    words = re.findall(r"\w+", q)
+    if not words:
+        return ""
+    terms = ['"' + word + '"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def attachment_passages(db: Session, conversation_id: int, words: List[str], limit: int, tokens: int) -> List[dict]:
+    """Best-matching raw passages from a conversation's attachments for any of the words."""
+    if not words:
+        return []
+    rows = db.execute(text("""
+        SELECT a.filename AS filename, snippet(attachments_fts, 1, '', '', '…', :tokens) AS passage
+        FROM attachments_fts JOIN attachments a ON a.id = attachments_fts.rowid
+        WHERE attachments_fts MATCH :query AND a.conversation_id = :conversation_id
+        ORDER BY rank LIMIT :limit
+    """), {
+        "query": " OR ".join('"' + word + '"' for word in words),
+        "conversation_id": conversation_id,
+        "tokens": tokens,
+        "limit": limit,
+    }).mappings().all()
+    return [dict(row) for row in rows]
+
+
+def search(db: Session, q: str, conversation_id: Optional[int] = None, limit: int = 20, offset: int = 0) -> dict:
+    match_query = build_match_query(q)
+    if not match_query:
+        return {"query": q, "results": [], "has_more": False}
+
+    def conversation_filter(alias):
+        return f"AND {alias}.conversation_id = :conversation_id" if conversation_id is not None else ""
+
+    sql = _SEARCH_SQL.format(
+        conversation_filter_c="AND c.id = :conversation_id" if conversation_id is not None else "",
+        conversation_filter_m=conversation_filter("m"),
+        conversation_filter_a=conversation_filter("a"),
+    )
+    # Fetch one extra row to know whether another page exists
+    rows = db.execute(text(sql), {
+        "query": match_query,
+        "conversation_id": conversation_id,
+        "open": HIGHLIGHT_OPEN,
+        "close": HIGHLIGHT_CLOSE,
+        "tokens": SNIPPET_TOKENS,
+        "window": offset + limit + 1,
+        "limit": limit + 1,
+        "offset": offset,
+    }).mappings().all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    titles = {}
+    conversation_ids = {row["conversation_id"] for row in rows}
+    if conversation_ids:
+        title_rows = db.query(models.Conversation.id, models.Conversation.title).filter(
+            models.Conversation.id.in_(conversation_ids)
+        ).all()
+        titles = {conv_id: title for conv_id, title in title_rows}
+
+    results = [
+        {
+            "kind": row["kind"],
+            "id": row["id"],
+            "conversation_id": row["conversation_id"],
+            "conversation_title": titles.get(row["conversation_id"]),
+            "snippet": row["snippet"] or "",
+            "rank": row["rank"],
+        }
+        for row in rows
+    ]
+    return {"query": q, "results": results, "has_more": has_more}
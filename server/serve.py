@@ -0,0 +1,76 @@
+"""Production entry point: several uvicorn worker processes behind one socket.
+
+    python serve.py --workers 4
+
+`python main.py` remains the single-process development server with reload.
+Every option can also be set through the environment (see the defaults
+below); the database itself is configured in database.py via DATABASE_URL
+and the DB_POOL_* settings.
+"""
+import argparse
+import os
+
+import uvicorn
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the Gen AI API with multiple workers.")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=_env_int("PORT", 8001))
+    parser.add_argument("--workers", type=int, default=_env_int("WEB_CONCURRENCY", os.cpu_count() or 1))
+    # Longer than the client's polling interval so polls reuse their connection
+    parser.add_argument("--keep-alive", type=int, default=_env_int("KEEP_ALIVE", 30))
+    parser.add_argument("--backlog", type=int, default=_env_int("BACKLOG", 2048))
+    # Per worker; beyond this requests get 503 instead of queueing without bound
+    parser.add_argument("--limit-concurrency", type=int, default=_env_int("LIMIT_CONCURRENCY", 200))
+    # Recycle a worker after this many requests (0 disables)
+    parser.add_argument("--limit-max-requests", type=int, default=_env_int("LIMIT_MAX_REQUESTS", 0))
+    parser.add_argument("--graceful-timeout", type=int, default=_env_int("GRACEFUL_TIMEOUT", 30))
+    return parser.parse_args()
+
+
+def prepare_database():
+    """One-time startup work that must not race between workers."""
+    import database
+    import jobs
+    import migrations
+    import models
+
+    models.Base.metadata.create_all(bind=database.engine)
+    migrations.run_migrations(database.engine)
+    jobs.requeue_interrupted()
+    # Workers are fresh processes; don't keep idle connections open in the supervisor
+    database.engine.dispose()
+
+
+def main():
+    args = parse_args()
+
+    if args.workers > 1:
+        # Module-level state would otherwise be per process
+        os.environ.setdefault("STATE_BACKEND", "sqlite")
+    prepare_database()
+    # Tells the workers that tables, migrations and job recovery are done
+    os.environ["DATABASE_PREPARED"] = "1"
+
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_keep_alive=args.keep_alive,
+        backlog=args.backlog,
+        limit_concurrency=args.limit_concurrency,
+        limit_max_requests=args.limit_max_requests or None,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        proxy_headers=True,
+        access_log=False,
+    )
+
+
+if __name__ == "__main__":
+    main()
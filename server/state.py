@@ -0,0 +1,177 @@
+"""Runtime state that every worker process must agree on.
+
+Rate-limit windows, leader locks for background jobs and small caches go
+through a StateStore. MemoryStateStore suits a single process;
+SQLiteStateStore keeps the state in a small SQLite file so any number of
+worker processes on the host share it.
+"""
+import os
+import socket
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Optional
+
+# "memory" or "sqlite"; the production launcher switches to sqlite for multiple workers
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "./runtime_state.db")
+# How often hit() also drops expired hits of every other key, so clients
+# that never return don't leave rows behind
+SWEEP_INTERVAL_SECONDS = 300
+
+
+class StateStore(ABC):
+    @abstractmethod
+    def hit(self, key: str, window_seconds: float, limit: int) -> bool:
+        """Record a hit for key unless it already has `limit` hits in the window."""
+
+    @abstractmethod
+    def acquire_lock(self, name: str, owner: str, ttl_seconds: float) -> bool:
+        """Take or renew a named lease; False while another owner holds it."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        """Cached value for key, or None once it has expired."""
+
+    @abstractmethod
+    def set(self, key: str, value: str, ttl_seconds: float):
+        """Cache value under key for ttl_seconds."""
+
+
+class MemoryStateStore(StateStore):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hits = defaultdict(list)
+        self._leases = {}
+        self._values = {}
+        self._last_sweep = time.time()
+
+    def hit(self, key, window_seconds, limit):
+        now = time.time()
+        with self._lock:
+            if now - self._last_sweep >= SWEEP_INTERVAL_SECONDS:
+                self._last_sweep = now
+                for stale in [k for k, hits in self._hits.items() if not hits or now - hits[-1] >= window_seconds]:
+                    del self._hits[stale]
+            # Filter out timestamps older than current window
+            hits = [t for t in self._hits[key] if now - t < window_seconds]
+            allowed = len(hits) < limit
+            if allowed:
+                hits.append(now)
+            self._hits[key] = hits
+            return allowed
+
+    def acquire_lock(self, name, owner, ttl_seconds):
+        now = time.time()
+        with self._lock:
+            holder = self._leases.get(name)
+            if holder and holder[0] != owner and holder[1] > now:
+                return False
+            self._leases[name] = (owner, now + ttl_seconds)
+            return True
+
+    def get(self, key):
+        with self._lock:
+            entry = self._values.get(key)
+            if entry and entry[1] > time.time():
+                return entry[0]
+            return None
+
+    def set(self, key, value, ttl_seconds):
+        now = time.time()
+        with self._lock:
+            # Cache keys embed a version, so old entries are never read again
+            for expired in [k for k, entry in self._values.items() if entry[1] <= now]:
+                del self._values[expired]
+            self._values[key] = (value, now + ttl_seconds)
+
+
+class SQLiteStateStore(StateStore):
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._last_sweep = time.time()
+        with self._transaction() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS rate_hits (key TEXT NOT NULL, ts REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_rate_hits_key_ts ON rate_hits (key, ts)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_rate_hits_ts ON rate_hits (ts)")
+            conn.execute("CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode; writes take the lock up front with BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def hit(self, key, window_seconds, limit):
+        now = time.time()
+        with self._transaction() as conn:
+            if now - self._last_sweep >= SWEEP_INTERVAL_SECONDS:
+                self._last_sweep = now
+                conn.execute("DELETE FROM rate_hits WHERE ts <= ?", (now - window_seconds,))
+            else:
+                conn.execute("DELETE FROM rate_hits WHERE key = ? AND ts <= ?", (key, now - window_seconds))
+            (count,) = conn.execute("SELECT COUNT(*) FROM rate_hits WHERE key = ?", (key,)).fetchone()
+            if count >= limit:
+                return False
+            conn.execute("INSERT INTO rate_hits (key, ts) VALUES (?, ?)", (key, now))
+            return True
+
+    def acquire_lock(self, name, owner, ttl_seconds):
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT owner, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+            if row and row[0] != owner and row[1] > now:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO leases (name, owner, expires_at) VALUES (?, ?, ?)",
+                (name, owner, now + ttl_seconds)
+            )
+            return True
+
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT value FROM kv WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ttl_seconds):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM kv WHERE expires_at <= ?", (time.time(),))
+            conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + ttl_seconds)
+            )
+
+
+def create_store() -> StateStore:
+    if STATE_BACKEND == "sqlite":
+        return SQLiteStateStore(STATE_DB_PATH)
+    if STATE_BACKEND == "memory":
+        return MemoryStateStore()
+    raise ValueError(f"Unknown STATE_BACKEND {STATE_BACKEND!r}")
+
+
+# Identifies this process when taking leases
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}"
+
+store = create_store()
@@ -0,0 +1,267 @@
+"""Streaming NDJSON export and import of conversations.
+
+Each line is one record. A "conversation" record is followed by the
+"attachment" and "message" records that belong to it; a message carries its
+latest feedback inline. Ids are not exported, so an import always creates new
+rows.
+
+Imports commit at conversation boundaries. A failed import reports the last
+committed line, and passing that line back as resume_after_line continues
+where it stopped without duplicating anything.
+"""
+import datetime
+import gzip
+import io
+import json
+import zlib
+from typing import BinaryIO, Iterable, Iterator, List, Optional
+
+from sqlalchemy import exc, func, select
+from sqlalchemy.orm import aliased
+
+import database
+import digests
+import models
+
+EXPORT_BATCH_SIZE = 500
+IMPORT_BATCH_SIZE = 1000
+CHUNK_BYTES = 64 * 1024
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+class ImportFailed(ValueError):
+    def __init__(self, message: str, committed_line: int):
+        super().__init__(message)
+        self.committed_line = committed_line
+
+
+def _timestamp(value: Optional[datetime.datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def _parse_timestamp(value: Optional[str]) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(value) if value else datetime.datetime.utcnow()
+
+
+def export_records(conversation_ids: Optional[List[int]] = None) -> Iterator[dict]:
+    # Column queries with yield_per stream rows from a server-side cursor
+    # without filling the session's identity map.
+    db = database.SessionLocal()
+    try:
+        conversations = db.query(
+            models.Conversation.id,
+            models.Conversation.title,
+            models.Conversation.system_prompt,
+            models.Conversation.temperature,
+            models.Conversation.selected_model,
+            models.Conversation.created_at,
+            models.Conversation.updated_at,
+        ).order_by(models.Conversation.id)
+        if conversation_ids:
+            conversations = conversations.filter(models.Conversation.id.in_(conversation_ids))
+
+        for conv in conversations.yield_per(EXPORT_BATCH_SIZE):
+            yield {
+                "type": "conversation",
+                "title": conv.title,
+                "system_prompt": conv.system_prompt,
+                "temperature": conv.temperature,
+                "selected_model": conv.selected_model,
+                "created_at": _timestamp(conv.created_at),
+                "updated_at": _timestamp(conv.updated_at),
+            }
+
+            attachments = db.query(
+                models.Attachment.filename,
+                models.Attachment.content,
+                models.Attachment.created_at,
+            ).filter(models.Attachment.conversation_id == conv.id).order_by(models.Attachment.id)
+            for att in attachments.yield_per(EXPORT_BATCH_SIZE):
+                yield {
+                    "type": "attachment",
+                    "filename": att.filename,
+                    "content": att.content,
+                    "created_at": _timestamp(att.created_at),
+                }
+
+            # A message can collect several feedback rows (every thumbs click
+            # adds one); export only the latest so each message is one record.
+            newer = aliased(models.Feedback)
+            latest_feedback_id = select(func.max(newer.id)).where(
+                newer.message_id == models.Message.id
+            ).scalar_subquery()
+            messages = db.query(
+                models.Message.role,
+                models.Message.content,
+                models.Message.created_at,
+                models.Feedback.id.label("feedback_id"),
+                models.Feedback.is_positive,
+                models.Feedback.comment,
+                models.Feedback.created_at.label("feedback_created_at"),
+            ).outerjoin(models.Feedback, models.Feedback.id == latest_feedback_id).filter(
+                models.Message.conversation_id == conv.id
+            ).order_by(models.Message.id)
+            for msg in messages.yield_per(EXPORT_BATCH_SIZE):
+                yield {
+                    "type": "message",
+                    "role": msg.role,
+                    "content": msg.content,
+                    "created_at": _timestamp(msg.created_at),
+                    "feedback": {
+                        "is_positive": msg.is_positive,
+                        "comment": msg.comment,
+                        "created_at": _timestamp(msg.feedback_created_at),
+                    } if msg.feedback_id is not None else None,
+                }
+    finally:
+        db.close()
+
+
+def _chunked(lines: Iterable[str]) -> Iterator[bytes]:
+    # Yield ~64KB chunks; one write per record would dominate the export time
+    buffer = []
+    size = 0
+    for line in lines:
+        data = line.encode("utf-8")
+        buffer.append(data)
+        size += len(data)
+        if size >= CHUNK_BYTES:
+            yield b"".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def export_ndjson(conversation_ids: Optional[List[int]] = None, compress: bool = False) -> Iterator[bytes]:
+    lines = (json.dumps(record, ensure_ascii=False) + "\n" for record in export_records(conversation_ids))
+    chunks = _chunked(lines)
+    if not compress:
+        yield from chunks
+        return
+
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) # wbits=31 writes a gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def import_ndjson(fileobj: BinaryIO, resume_after_line: int = 0, atomic: bool = False) -> dict:
+    """Import an export stream (plain or gzip), skipping lines up to resume_after_line.
+
+    Work is committed at the first conversation boundary after every
+    IMPORT_BATCH_SIZE records, so the SQLite write lock and the WAL stay
+    small and other writers are not blocked for the length of the import.
+    With atomic=True nothing is committed until the whole file has been
+    read. On a bad line the uncommitted part is rolled back and an
+    ImportFailed names the line and the last committed one.
+    """
+    if fileobj.read(2) == GZIP_MAGIC:
+        fileobj.seek(0)
+        fileobj = gzip.GzipFile(fileobj=fileobj, mode="rb")
+    else:
+        fileobj.seek(0)
+    lines = io.TextIOWrapper(fileobj, encoding="utf-8")
+
+    counts = {"conversations": 0, "attachments": 0, "messages": 0, "feedbacks": 0}
+    db = database.SessionLocal()
+    line_number = 0
+    last_line = committed_line = resume_after_line
+
+    def fail(message: str, cause: Exception):
+        db.rollback()
+        if atomic:
+            message += "; nothing was imported"
+        elif committed_line > resume_after_line:
+            message += f"; lines up to {committed_line} were imported, resume after line {committed_line}"
+        raise ImportFailed(message, committed_line) from cause
+
+    try:
+        conversation_id = None
+        pending = 0
+        for line_number, line in enumerate(lines, start=1):
+            if line_number <= resume_after_line or not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                kind = record["type"]
+                if kind == "conversation":
+                    if pending >= IMPORT_BATCH_SIZE:
+                        # A conversation boundary: everything before this line is complete
+                        if atomic:
+                            db.flush()
+                        else:
+                            db.commit()
+                            committed_line = last_line
+                        db.expunge_all()
+                        pending = 0
+                    conversation = models.Conversation(
+                        title=record.get("title"),
+                        system_prompt=record.get("system_prompt"),
+                        temperature=record.get("temperature"),
+                        selected_model=record.get("selected_model"),
+                        created_at=_parse_timestamp(record.get("created_at")),
+                        updated_at=_parse_timestamp(record.get("updated_at")),
+                    )
+                    db.add(conversation)
+                    db.flush() # Children need the new id
+                    conversation_id = conversation.id
+                    counts["conversations"] += 1
+                elif conversation_id is None:
+                    raise ValueError(f"{kind} record before any conversation")
+                elif kind == "attachment":
+                    attachment = models.Attachment(
+                        conversation_id=conversation_id,
+                        filename=record.get("filename"),
+                        content=record.get("content"),
+                        created_at=_parse_timestamp(record.get("created_at")),
+                    )
+                    # Digests are derived data, so they are rebuilt rather than exported
+                    digests.apply_digest(attachment, attachment.content)
+                    db.add(attachment)
+                    counts["attachments"] += 1
+                elif kind == "message":
+                    message = models.Message(
+                        conversation_id=conversation_id,
+                        role=record.get("role"),
+                        content=record.get("content"),
+                        created_at=_parse_timestamp(record.get("created_at")),
+                    )
+                    feedback = record.get("feedback")
+                    if feedback:
+                        message.feedback = models.Feedback(
+                            conversation_id=conversation_id,
+                            is_positive=feedback.get("is_positive"),
+                            comment=feedback.get("comment"),
+                            created_at=_parse_timestamp(feedback.get("created_at")),
+                        )
+                        counts["feedbacks"] += 1
+                    db.add(message)
+                    counts["messages"] += 1
+                else:
+                    raise ValueError(f"unknown record type {kind!r}")
+            except (KeyError, TypeError, ValueError) as e:
+                fail(f"Line {line_number}: {e}", e)
+            except exc.IntegrityError as e:
+                fail(f"Line {line_number}: {e.orig}", e)
+
+            last_line = line_number
+            pending += 1
+        db.commit()
+    except (OSError, EOFError, zlib.error) as e:
+        # Corrupt or truncated gzip data surfaces while reading lines
+        fail(f"Unreadable import file after line {line_number}: {e}", e)
+    except exc.IntegrityError as e:
+        # Raised by the final commit's flush
+        fail(f"Line {line_number}: {e.orig}", e)
+    except ImportFailed:
+        raise
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    counts["last_line"] = last_line
+    return counts
@@ -0,0 +1,65 @@
+import digests
+
+
+def lab_names(filename: str, text: str):
+    return [lab["name"] for lab in digests.build_digest(filename, text)["lab_values"]]
+
+
+def test_digests():
+    print("--- Starting Digest Verification ---")
+
+    # 1. Raw report text: only lines with a unit or a flag are lab values
+    report = "\n".join([
+        "Blood test report",
+        "Patient ID: 483920",
+        "Age: 45",
+        "Date: 2024-01-05",
+        "Hemoglobin: 11.2 g/dL (Low)",
+        "PCV = 33 %",
+        "Platelets    2.1  lakhs/cumm",
+        "WBC: 7200 (Normal)",
+        "Glucose 110 mg/dL",
+        "Creatinine 1.2 mg/dL",
+        "Weight: 70 kg",
+        "BP: 120/80 mmHg",
+        "Collected 12/03/2024",
+    ])
+    labs = digests.build_digest("r.txt", report)["lab_values"]
+    names = [lab["name"] for lab in labs]
+    print(f"Report lab values: {names}")
+    assert names == [
+        "Hemoglobin", "PCV", "Platelets", "WBC", "Glucose", "Creatinine", "Weight",
+        "BP systolic", "BP diastolic",
+    ]
+    assert [(lab["value"], lab["unit"]) for lab in labs[-2:]] == [(120, "mmHg"), (80, "mmHg")]
+
+    # 2. Notes are not a report, even with a heading or a mention of one
+    names = lab_names("notes.md", "# Release\nVersion: 3 released\nTimeout: 30 seconds\n")
+    print(f"Notes lab values: {names}")
+    assert names == []
+    names = lab_names("meeting.md", "# Weekly report\nGrowth: 12 %\nTimeout: 30 min\n")
+    print(f"Meeting notes lab values: {names}")
+    assert names == []
+
+    # 3. analyze_report_* output: the Key Findings section lists values without units
+    analysis = "\n".join([
+        "## 📄 Report Summary",
+        "- Mild anemia.",
+        "## 🧪 Key Findings",
+        "- **Hemoglobin**: 10.9 (Low)",
+        "- PCV: 31",
+        "- Report Date: 2024-01-05",
+        "## ⚠️ Severity",
+        "Low",
+    ])
+    digest = digests.build_digest("scan.png", analysis)
+    print(digests.format_digest("scan.png", digest))
+    assert [lab["name"] for lab in digest["lab_values"]] == ["Hemoglobin", "PCV"]
+    assert digest["lab_values"][0]["flag"] == "Low"
+    assert "Severity: Low" in digest["findings"]
+
+    print("--- Digest Verification Passed ---")
+
+
+if __name__ == "__main__":
+    test_digests()
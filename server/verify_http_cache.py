@@ -0,0 +1,74 @@
+import json
+import time
+
+import requests
+
+BASE_URL = "http://localhost:8002"
+
+
+def rate(conv_id: int, message_id: int):
+    requests.post(f"{BASE_URL}/feedback", json={
+        "message_id": message_id,
+        "conversation_id": conv_id,
+        "is_positive": True,
+    })
+
+
+def test_http_cache():
+    print("--- Starting Conditional GET Verification ---")
+
+    # 1. Import a conversation with a message so feedback can change it without Gemini calls
+    records = [
+        {"type": "conversation", "title": "Cache Test"},
+        {"type": "message", "role": "user", "content": "Hello"},
+    ]
+    requests.post(f"{BASE_URL}/import", files={"file": ("cache.ndjson", "".join(json.dumps(r) + "\n" for r in records))})
+    conversations = requests.get(f"{BASE_URL}/conversations", params={"limit": 1000}).json()
+    conv_id = max(c["id"] for c in conversations)
+    url = f"{BASE_URL}/conversations/{conv_id}"
+    message_id = requests.get(url).json()["messages"][0]["id"]
+
+    # 2. If-None-Match with the current ETag
+    resp = requests.get(url)
+    etag = resp.headers["ETag"]
+    print(f"Conversation: {resp.status_code} ETag={etag} Last-Modified={resp.headers.get('Last-Modified')}")
+    resp = requests.get(url, headers={"If-None-Match": etag})
+    print(f"If-None-Match: {resp.status_code}")
+    assert resp.status_code == 304 and not resp.content
+
+    # 3. If-Modified-Since once the last write's second is over
+    time.sleep(1.1)
+    resp = requests.get(url)
+    last_modified = resp.headers["Last-Modified"]
+    resp = requests.get(url, headers={"If-Modified-Since": last_modified})
+    print(f"If-Modified-Since {last_modified}: {resp.status_code}")
+    assert resp.status_code == 304
+
+    # 4. A write right after the GET invalidates both validators
+    time.sleep(1.1)
+    resp = requests.get(url)
+    etag, last_modified = resp.headers["ETag"], resp.headers["Last-Modified"]
+    rate(conv_id, message_id)
+    resp = requests.get(url, headers={"If-Modified-Since": last_modified})
+    print(f"If-Modified-Since after a write: {resp.status_code}")
+    assert resp.status_code == 200
+    resp = requests.get(url, headers={"If-None-Match": etag})
+    print(f"If-None-Match after a write: {resp.status_code}")
+    assert resp.status_code == 200
+
+    # 5. Conversation list and analytics revalidate by ETag
+    for path in ("/conversations", "/analytics"):
+        etag = requests.get(f"{BASE_URL}{path}").headers["ETag"]
+        resp = requests.get(f"{BASE_URL}{path}", headers={"If-None-Match": etag})
+        print(f"{path} If-None-Match: {resp.status_code}")
+        assert resp.status_code == 304
+        rate(conv_id, message_id)
+        resp = requests.get(f"{BASE_URL}{path}", headers={"If-None-Match": etag})
+        print(f"{path} after a write: {resp.status_code}")
+        assert resp.status_code == 200
+
+    print("--- Conditional GET Verification Passed ---")
+
+
+if __name__ == "__main__":
+    test_http_cache()
@@ -0,0 +1,100 @@
+import gzip
+import json
+
+import requests
+
+BASE_URL = "http://localhost:8002"
+
+
+def read_records(data: bytes):
+    return [json.loads(line) for line in data.decode("utf-8").splitlines() if line.strip()]
+
+
+def conversation_ids():
+    return [c["id"] for c in requests.get(f"{BASE_URL}/conversations", params={"limit": 1000}).json()]
+
+
+def import_file(name: str, data: bytes, **params):
+    return requests.post(f"{BASE_URL}/import", files={"file": (name, data)}, params=params)
+
+
+def test_transfer():
+    print("--- Starting Export/Import Verification ---")
+
+    # 1. Import a known conversation (no Gemini calls needed)
+    source = [
+        {"type": "conversation", "title": "Transfer Round Trip", "temperature": 0.7},
+        {"type": "attachment", "filename": "notes.txt", "content": "Hemoglobin: 11.2 g/dL (Low)"},
+        {"type": "message", "role": "user", "content": "What does my report say?"},
+        {"type": "message", "role": "model", "content": "Your hemoglobin is slightly low."},
+    ]
+    resp = import_file("source.ndjson", "".join(json.dumps(r) + "\n" for r in source).encode("utf-8"))
+    print(f"Import: {resp.status_code} - {resp.json()}")
+    assert resp.status_code == 200
+
+    conv_id = max(conversation_ids())
+    messages = requests.get(f"{BASE_URL}/conversations/{conv_id}").json()["messages"]
+    print(f"Imported conversation {conv_id} with {len(messages)} messages")
+
+    # 2. Rate the reply twice; only the latest feedback should be exported
+    for is_positive in (False, True):
+        requests.post(f"{BASE_URL}/feedback", json={
+            "message_id": messages[1]["id"],
+            "conversation_id": conv_id,
+            "is_positive": is_positive,
+        })
+
+    # 3. Export (plain and gzip) and check there is one record per message
+    exported = requests.get(f"{BASE_URL}/export", params={"conversation_ids": [conv_id]}).content
+    records = read_records(exported)
+    message_records = [r for r in records if r["type"] == "message"]
+    print(f"Exported {len(records)} records, {len(message_records)} messages")
+    assert len(message_records) == len(messages)
+    assert message_records[1]["feedback"]["is_positive"] is True
+
+    compressed = requests.get(f"{BASE_URL}/export", params={"conversation_ids": [conv_id], "compress": True}).content
+    assert read_records(gzip.decompress(compressed)) == records
+
+    # 4. Import the export again and compare the copy with the original
+    resp = import_file("export.ndjson.gz", compressed)
+    print(f"Re-import: {resp.status_code} - {resp.json()}")
+    assert resp.json()["messages"] == len(messages)
+
+    copy_id = max(conversation_ids())
+    copy = requests.get(f"{BASE_URL}/conversations/{copy_id}").json()
+    assert [(m["role"], m["content"]) for m in copy["messages"]] == [(m["role"], m["content"]) for m in messages]
+    assert [a["filename"] for a in copy["attachments"]] == ["notes.txt"]
+    print(f"Round trip OK: conversation {copy_id} matches {conv_id}")
+
+    # 5. A bad line keeps the conversations committed before it; the import resumes from there
+    big = [{"type": "conversation", "title": "Big Import"}]
+    big += [{"type": "message", "role": "user", "content": f"Message {i}"} for i in range(1000)]
+    big += [{"type": "conversation", "title": "After Batch"}]
+    good = "".join(json.dumps(r) + "\n" for r in big).encode("utf-8")
+    broken = good + b"{not json\n"
+
+    before = conversation_ids()
+    resp = import_file("broken.ndjson", broken, atomic=True)
+    print(f"Broken atomic import: {resp.status_code} - {resp.json()['detail']}")
+    assert resp.status_code == 400 and conversation_ids() == before
+
+    resp = import_file("broken.ndjson", broken)
+    detail = resp.json()["detail"]
+    print(f"Broken import: {resp.status_code} - {detail}")
+    assert resp.status_code == 400 and detail["committed_line"] == 1001
+    assert len(conversation_ids()) == len(before) + 1
+
+    resp = import_file("fixed.ndjson", good, resume_after_line=detail["committed_line"])
+    print(f"Resumed import: {resp.status_code} - {resp.json()}")
+    assert resp.json()["conversations"] == 1 and resp.json()["last_line"] == len(big)
+    assert len(conversation_ids()) == len(before) + 2
+
+    resp = import_file("broken.ndjson.gz", compressed[:len(compressed) // 2])
+    print(f"Truncated gzip: {resp.status_code} - {resp.json()['detail']}")
+    assert resp.status_code == 400
+
+    print("--- Export/Import Verification Passed ---")
+
+
+if __name__ == "__main__":
+    test_transfer()